@@ -78,6 +78,9 @@ class AppConfig(BaseModel):
     # Logging
     log_level: str = Field(default="INFO", description="Logging level")
     
+    # In-process Convex query cache; only coherent when a single worker serves traffic
+    query_cache_enabled: bool = Field(default=False, description="Cache read-only Convex queries in-process")
+    
     class Config:
         env_file = ".env"
         env_file_encoding = "utf-8"
@@ -119,6 +122,7 @@ def load_config() -> AppConfig:
             "health_check_interval": int(os.getenv("HEALTH_CHECK_INTERVAL", "30")),
             "health_check_timeout": int(os.getenv("HEALTH_CHECK_TIMEOUT", "10")),
             "log_level": os.getenv("LOG_LEVEL", "INFO").upper(),
+            "query_cache_enabled": os.getenv("QUERY_CACHE_ENABLED", "false").lower() == "true",
         }
         
         return AppConfig(**config_data)
@@ -1,14 +1,20 @@
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Query
 from fastapi.middleware.cors import CORSMiddleware
-from pydantic import BaseModel
+from fastapi.middleware.gzip import GZipMiddleware
+from fastapi.responses import ORJSONResponse, Response
+from pydantic import BaseModel, ConfigDict
 import uvicorn
+import asyncio
 import logging
+import os
+import orjson
+from contextlib import asynccontextmanager
 from datetime import datetime
 from typing import Dict, Any
 
 from backend.config import config
-from backend.services.health_checker import health_checker, HealthStatus
-from backend.routers.admin import router as admin_router
+from backend.services.health_checker import health_checker, HealthStatus, ServiceHealth
+from backend.routers.admin import router as admin_router, aclose_convex_client
 
 # Configure logging
 logging.basicConfig(
@@ -17,11 +23,28 @@ logging.basicConfig(
 )
 logger = logging.getLogger(__name__)
 
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """Application startup and shutdown hooks."""
+    # Surface the active loop so a silent fallback from uvloop is visible
+    loop_type = type(asyncio.get_running_loop())
+    logger.info("Event loop: %s.%s", loop_type.__module__, loop_type.__name__)
+    # Shared clients are created lazily, so a later lifespan in the same process reopens them
+    try:
+        yield
+    finally:
+        try:
+            await aclose_convex_client()
+        finally:
+            await health_checker.aclose()
+
 app = FastAPI(
     title="YC Agent API", 
     version="1.0.0",
     description="AI Browser Testing Orchestrator Backend API",
-    debug=config.debug
+    debug=config.debug,
+    default_response_class=ORJSONResponse,
+    lifespan=lifespan
 )
 
 # Enable CORS for frontend connection
@@ -33,6 +56,9 @@ app.add_middleware(
     allow_headers=["*"],
 )
 
+# Compress larger JSON payloads (admin lists, aggregate health)
+app.add_middleware(GZipMiddleware, minimum_size=500, compresslevel=5)
+
 # Include routers
 app.include_router(admin_router)
 
@@ -48,6 +74,9 @@ class HealthResponse(BaseModel):
     details: Dict[str, Any] = {}
 
 class ServiceHealthResponse(BaseModel):
+    # Built server-side via model_construct and never mutated afterwards
+    model_config = ConfigDict(extra="forbid", frozen=True)
+    
     service: str
     status: str
     message: str
@@ -56,98 +85,95 @@ class ServiceHealthResponse(BaseModel):
     details: Dict[str, Any] = {}
     error: str = None
 
+def to_service_health_response(health: ServiceHealth) -> ServiceHealthResponse:
+    """Convert a ServiceHealth result into the API response model."""
+    # Values come from the health checker, not the client, so skip validation;
+    # the routes return it without a response_model so FastAPI doesn't validate it either
+    return ServiceHealthResponse.model_construct(
+        service=health.service,
+        status=health.status.value,
+        message=health.message,
+        response_time_ms=health.response_time_ms,
+        last_checked=health.last_checked.isoformat(),
+        details=health.details or {},
+        error=health.error
+    )
+
+# Static parts of the probe responses; handlers only stamp the timestamp
+_ROOT_PAYLOAD = {
+    "message": "YC Agent API is running!",
+    "version": "1.0.0",
+    "debug": config.debug
+}
+_MESSAGE_TEMPLATE = MessageResponse(
+    message="Hello from FastAPI backend!",
+    status="success",
+    timestamp=""
+)
+
 @app.get("/")
 async def root():
     """Root endpoint returning basic server information."""
-    return {
-        "message": "YC Agent API is running!",
-        "version": "1.0.0",
-        "timestamp": datetime.now().isoformat(),
-        "debug": config.debug
-    }
-
-@app.get("/api/message", response_model=MessageResponse)
+    return {**_ROOT_PAYLOAD, "timestamp": datetime.now()}
+
+@app.get("/api/message", response_model=None, responses={200: {"model": MessageResponse}})
 async def get_message():
     """Basic message endpoint for testing connectivity."""
-    return MessageResponse(
-        message="Hello from FastAPI backend!",
-        status="success",
-        timestamp=datetime.now().isoformat()
-    )
+    return _MESSAGE_TEMPLATE.model_copy(update={"timestamp": datetime.now().isoformat()})
+
+# Pre-serialized /health body; only the timestamp changes between probes
+_HEALTH_PREFIX = b'{"status":"healthy","service":"fastapi-backend","timestamp":"'
+_HEALTH_SUFFIX = b'","details":' + orjson.dumps({
+    "version": "1.0.0",
+    "debug": config.debug,
+    "uptime": "running"
+}) + b'}'
 
 @app.get("/health", response_model=HealthResponse)
 async def basic_health_check():
     """Basic health check for the FastAPI server itself."""
-    return HealthResponse(
-        status="healthy",
-        service="fastapi-backend",
-        timestamp=datetime.now().isoformat(),
-        details={
-            "version": "1.0.0",
-            "debug": config.debug,
-            "uptime": "running"
-        }
+    return Response(
+        content=_HEALTH_PREFIX + datetime.now().isoformat().encode() + _HEALTH_SUFFIX,
+        media_type="application/json"
     )
 
-@app.get("/api/health/openai", response_model=ServiceHealthResponse)
+@app.get("/api/health/openai", response_model=None, responses={200: {"model": ServiceHealthResponse}})
 async def check_openai_health():
     """Test OpenAI API connection and functionality."""
     try:
         health = await health_checker.check_openai_health()
-        return ServiceHealthResponse(
-            service=health.service,
-            status=health.status.value,
-            message=health.message,
-            response_time_ms=health.response_time_ms,
-            last_checked=health.last_checked.isoformat(),
-            details=health.details or {},
-            error=health.error
-        )
+        return to_service_health_response(health)
     except Exception as e:
-        logger.error(f"OpenAI health check failed: {str(e)}")
+        logger.error("OpenAI health check failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
 
-@app.get("/api/health/browser-use-cloud", response_model=ServiceHealthResponse)
+@app.get("/api/health/browser-use-cloud", response_model=None, responses={200: {"model": ServiceHealthResponse}})
 async def check_browser_use_health():
     """Test Browser Use Cloud API connection."""
     try:
         health = await health_checker.check_browser_use_health()
-        return ServiceHealthResponse(
-            service=health.service,
-            status=health.status.value,
-            message=health.message,
-            response_time_ms=health.response_time_ms,
-            last_checked=health.last_checked.isoformat(),
-            details=health.details or {},
-            error=health.error
-        )
+        return to_service_health_response(health)
     except Exception as e:
-        logger.error(f"Browser Use Cloud health check failed: {str(e)}")
+        logger.error("Browser Use Cloud health check failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
 
-@app.get("/api/health/convex", response_model=ServiceHealthResponse)
+@app.get("/api/health/convex", response_model=None, responses={200: {"model": ServiceHealthResponse}})
 async def check_convex_health():
     """Test Convex database connection."""
     try:
         health = await health_checker.check_convex_health()
-        return ServiceHealthResponse(
-            service=health.service,
-            status=health.status.value,
-            message=health.message,
-            response_time_ms=health.response_time_ms,
-            last_checked=health.last_checked.isoformat(),
-            details=health.details or {},
-            error=health.error
-        )
+        return to_service_health_response(health)
     except Exception as e:
-        logger.error(f"Convex health check failed: {str(e)}")
+        logger.error("Convex health check failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
 
 @app.get("/api/health/all")
-async def check_all_services_health():
+async def check_all_services_health(
+    refresh: bool = Query(default=False, description="Bypass the cached result and probe every service")
+):
     """Comprehensive health check for all external services."""
     try:
-        overall_health = await health_checker.get_overall_health_status()
+        overall_health = await health_checker.get_overall_health_status(force_refresh=refresh)
         
         # Set appropriate HTTP status code based on overall health
         if overall_health["overall_status"] == HealthStatus.UNHEALTHY:
@@ -158,12 +184,12 @@ async def check_all_services_health():
             status_code = 200  # OK
         
         # Log health check summary
-        logger.info(f"Overall health check: {overall_health['overall_status']} - {overall_health['overall_message']}")
+        logger.info("Overall health check: %s - %s", overall_health['overall_status'], overall_health['overall_message'])
         
         return overall_health
         
     except Exception as e:
-        logger.error(f"Comprehensive health check failed: {str(e)}")
+        logger.error("Comprehensive health check failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Health check failed: {str(e)}")
 
 @app.get("/api/config/status")
@@ -196,7 +222,7 @@ async def get_configuration_status():
             "status": "configured" if configured_services >= 2 else "incomplete",
             "configured_services": configured_services,
             "total_services": 3,
-            "timestamp": datetime.now().isoformat(),
+            "timestamp": datetime.now(),
             "environment": env_status,
             "warnings": [
                 "OpenAI API key not configured" if not env_status["openai_configured"] else None,
@@ -206,18 +232,25 @@ async def get_configuration_status():
         }
         
     except Exception as e:
-        logger.error(f"Configuration status check failed: {str(e)}")
+        logger.error("Configuration status check failed: %s", e)
         raise HTTPException(status_code=500, detail=f"Configuration check failed: {str(e)}")
 
 if __name__ == "__main__":
     logger.info("Starting YC Agent FastAPI server...")
-    logger.info(f"Debug mode: {config.debug}")
-    logger.info(f"CORS origins: {config.cors_origins}")
+    logger.info("Debug mode: %s", config.debug)
+    logger.info("CORS origins: %s", config.cors_origins)
+    
+    if config.query_cache_enabled and not config.debug:
+        logger.warning("QUERY_CACHE_ENABLED with multiple workers: reads may not see writes made on another worker")
     
+    # reload and workers both require an import string; reload takes a single process
     uvicorn.run(
-        app, 
+        "backend.main:app",
         host="0.0.0.0", 
         port=8000,
+        loop="uvloop",
+        http="httptools",
+        workers=1 if config.debug else max(2, os.cpu_count() or 1),
         log_level=config.log_level.lower(),
         reload=config.debug
     )
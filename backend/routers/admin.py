@@ -4,12 +4,16 @@ Provides endpoints for CRUD operations on all database entities.
 """
 
 from fastapi import APIRouter, HTTPException, Query
+from fastapi.responses import ORJSONResponse
 from pydantic import BaseModel, Field
-from typing import List, Optional, Dict, Any, Union
+from typing import List, Optional, Dict, Any, Tuple
 from datetime import datetime
-import requests
-import json
+from functools import lru_cache
+import asyncio
+import httpx
 import logging
+import orjson
+import time
 
 from backend.config import config
 
@@ -17,6 +21,79 @@ logger = logging.getLogger(__name__)
 
 router = APIRouter(prefix="/api/admin", tags=["admin"])
 
+# Upper bound on in-flight Convex requests from this process
+CONVEX_MAX_CONCURRENCY = 16
+
+# Shared async client for Convex and the semaphore bounding it; created on first
+# use and closed from the app lifespan. Both bind to the running event loop, so
+# a later lifespan recreates them together.
+_convex_client: Optional[httpx.AsyncClient] = None
+_convex_semaphore: Optional[asyncio.Semaphore] = None
+
+def get_convex_client() -> httpx.AsyncClient:
+    """Return the shared Convex client, recreating it if a previous lifespan closed it."""
+    global _convex_client, _convex_semaphore
+    if _convex_client is None or _convex_client.is_closed:
+        _convex_semaphore = asyncio.Semaphore(CONVEX_MAX_CONCURRENCY)
+        _convex_client = httpx.AsyncClient(
+            http2=True,
+            timeout=10,
+            limits=httpx.Limits(
+                max_connections=100,
+                max_keepalive_connections=32,
+                keepalive_expiry=30
+            )
+        )
+    return _convex_client
+
+async def aclose_convex_client() -> None:
+    """Close the shared Convex client, if one was created."""
+    global _convex_client, _convex_semaphore
+    client, _convex_client = _convex_client, None
+    _convex_semaphore = None
+    if client is not None:
+        await client.aclose()
+
+# Convex HTTP API endpoints, resolved once at import
+CONVEX_QUERY_URL = f"{config.convex.deployment_url}/api/query"
+CONVEX_MUTATION_URL = f"{config.convex.deployment_url}/api/mutation"
+CONVEX_MUTATION_PREFIXES = ("create", "update", "remove")
+
+# Read-only Convex queries served from a short-lived in-process cache (TTL in seconds).
+# Writes only invalidate the cache of the worker that handled them, so
+# read-your-writes holds only with a single worker; the cache (and stats
+# stale-while-revalidate) is therefore opt-in via QUERY_CACHE_ENABLED.
+QUERY_CACHE_ENABLED = config.query_cache_enabled
+QUERY_CACHE_TTL = {
+    "testRuns:list": 5,
+    "testRuns:get": 15,
+    "flows:listByTestRun": 5,
+}
+QUERY_CACHE_MAX_ENTRIES = 1024
+_query_cache: Dict[bytes, Tuple[float, Any]] = {}
+
+# Admin stats use stale-while-revalidate: fresh for STATS_FRESH_SECONDS, then
+# served stale (with a background refresh) until STATS_STALE_SECONDS
+STATS_FRESH_SECONDS = 10
+STATS_STALE_SECONDS = 300
+_stats_cache: Dict[str, Any] = {}
+_stats_refresh_task: Optional[asyncio.Task] = None
+
+# Bumped on every write so reads started before it don't store stale results
+# in the query or stats cache
+_cache_generation = 0
+
+def invalidate_query_cache() -> None:
+    """Drop all cached query results after a write."""
+    global _cache_generation
+    _query_cache.clear()
+    _cache_generation += 1
+    # The next stats read refreshes inline; the old value is only a fallback
+    # for when Convex is unreachable
+    if _stats_cache:
+        _stats_cache["fresh_until"] = 0.0
+        _stats_cache["stale_until"] = 0.0
+
 # Pydantic models for request/response
 class TestRunCreate(BaseModel):
     name: str = Field(..., description="Name of the test run")
@@ -55,10 +132,18 @@ class SampleDataRequest(BaseModel):
 # Helper function to make Convex API calls
 async def call_convex_function(function_name: str, args: Dict[str, Any]) -> Any:
     """Call a Convex function via HTTP API."""
+    ttl = QUERY_CACHE_TTL.get(function_name) if QUERY_CACHE_ENABLED else None
+    if ttl is not None:
+        cache_key = function_name.encode() + orjson.dumps(args, option=orjson.OPT_SORT_KEYS)
+        cached = _query_cache.get(cache_key)
+        if cached and cached[0] > time.monotonic():
+            return cached[1]
+        generation = _cache_generation
+    
     try:
-        url = f"{config.convex.deployment_url}/api/query"
-        if function_name.startswith("create") or function_name.startswith("update") or function_name.startswith("remove"):
-            url = f"{config.convex.deployment_url}/api/mutation"
+        # Convex paths are "module:function"; the function name decides query vs mutation
+        is_mutation = function_name.rpartition(":")[2].startswith(CONVEX_MUTATION_PREFIXES)
+        url = CONVEX_MUTATION_URL if is_mutation else CONVEX_QUERY_URL
         
         payload = {
             "path": function_name,
@@ -69,23 +154,33 @@ async def call_convex_function(function_name: str, args: Dict[str, Any]) -> Any:
             "Content-Type": "application/json",
         }
         
-        response = requests.post(url, json=payload, headers=headers, timeout=10)
+        client = get_convex_client()
+        async with _convex_semaphore:
+            response = await client.post(url, content=orjson.dumps(payload), headers=headers)
         response.raise_for_status()
         
-        result = response.json()
+        result = orjson.loads(response.content)
         if "error" in result:
             raise HTTPException(status_code=400, detail=result["error"])
         
-        return result.get("value")
+        value = result.get("value")
+        # Skip the store if a write invalidated the cache while this query was in flight
+        if ttl is not None and generation == _cache_generation:
+            if len(_query_cache) >= QUERY_CACHE_MAX_ENTRIES:
+                _query_cache.clear()
+            _query_cache[cache_key] = (time.monotonic() + ttl, value)
         
-    except requests.RequestException as e:
-        logger.error(f"Convex API call failed: {str(e)}")
+        return value
+        
+    except httpx.HTTPError as e:
+        logger.error("Convex API call failed: %s", e)
         raise HTTPException(status_code=503, detail=f"Database connection failed: {str(e)}")
     except Exception as e:
-        logger.error(f"Unexpected error in Convex call: {str(e)}")
+        logger.error("Unexpected error in Convex call: %s", e)
         raise HTTPException(status_code=500, detail=f"Internal error: {str(e)}")
 
-@router.get("/test-runs", response_model=List[TestRunResponse])
+# Convex already returns well-typed rows; the model documents the schema without re-validating each item
+@router.get("/test-runs", response_model=None, responses={200: {"model": List[TestRunResponse]}})
 async def list_test_runs(
     limit: int = Query(default=20, le=100, description="Maximum number of test runs to return"),
     status: Optional[str] = Query(None, description="Filter by status")
@@ -106,11 +201,11 @@ async def list_test_runs(
         result = await call_convex_function("testRuns:list", args)
         
         if result and "page" in result:
-            return result["page"]
-        return []
+            return ORJSONResponse(content=result["page"])
+        return ORJSONResponse(content=[])
         
     except Exception as e:
-        logger.error(f"Failed to list test runs: {str(e)}")
+        logger.error("Failed to list test runs: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to list test runs: {str(e)}")
 
 @router.post("/test-runs", response_model=Dict[str, str])
@@ -129,11 +224,12 @@ async def create_test_run(test_run: TestRunCreate):
             args["metadata"] = test_run.metadata
             
         test_run_id = await call_convex_function("testRuns:create", args)
+        invalidate_query_cache()
         
         return {"testRunId": test_run_id}
         
     except Exception as e:
-        logger.error(f"Failed to create test run: {str(e)}")
+        logger.error("Failed to create test run: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to create test run: {str(e)}")
 
 @router.get("/test-runs/{test_run_id}")
@@ -151,7 +247,7 @@ async def get_test_run(test_run_id: str):
     except HTTPException:
         raise
     except Exception as e:
-        logger.error(f"Failed to get test run: {str(e)}")
+        logger.error("Failed to get test run: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get test run: {str(e)}")
 
 @router.get("/flows/{test_run_id}")
@@ -164,7 +260,7 @@ async def list_flows_for_test_run(test_run_id: str):
         return result or []
         
     except Exception as e:
-        logger.error(f"Failed to list flows: {str(e)}")
+        logger.error("Failed to list flows: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to list flows: {str(e)}")
 
 @router.post("/flows", response_model=Dict[str, str])
@@ -189,13 +285,94 @@ async def create_flow(flow: FlowCreate):
             args["metadata"] = flow.metadata
             
         flow_id = await call_convex_function("flows:create", args)
+        invalidate_query_cache()
         
         return {"flowId": flow_id}
         
     except Exception as e:
-        logger.error(f"Failed to create flow: {str(e)}")
+        logger.error("Failed to create flow: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to create flow: {str(e)}")
 
+# Sample test run templates
+TEST_RUN_TEMPLATES = (
+    {
+        "name": "E-commerce Checkout Flow",
+        "description": "Test the complete checkout process on an e-commerce site",
+        "prompt": "Test adding items to cart, proceeding to checkout, filling payment info, and completing purchase",
+        "metadata": {
+            "priority": "high",
+            "tags": ["e-commerce", "checkout", "payment"],
+            "environment": "staging"
+        }
+    },
+    {
+        "name": "User Registration & Login",
+        "description": "Test user authentication flows",
+        "prompt": "Test user registration with email verification and subsequent login",
+        "metadata": {
+            "priority": "normal",
+            "tags": ["auth", "registration", "login"],
+            "environment": "development"
+        }
+    },
+    {
+        "name": "Search & Navigation",
+        "description": "Test search functionality and site navigation",
+        "prompt": "Test search bar functionality, filters, and navigation between pages",
+        "metadata": {
+            "priority": "low",
+            "tags": ["search", "navigation", "ui"],
+            "environment": "staging"
+        }
+    }
+)
+
+# Sample flow templates; {name} is the owning test run's name
+FLOW_TEMPLATES = (
+    {
+        "name": "Flow 1 for {name}",
+        "description": "First testing scenario for {name}",
+        "instructions": "Navigate to the main page and perform the primary action for {name}",
+        "metadata": {
+            "difficulty": "easy",
+            "category": "primary",
+            "expectedSteps": 5
+        }
+    },
+    {
+        "name": "Flow 2 for {name}",
+        "description": "Secondary testing scenario for {name}",
+        "instructions": "Test edge cases and error handling for {name}",
+        "metadata": {
+            "difficulty": "medium",
+            "category": "edge-case",
+            "expectedSteps": 8
+        }
+    }
+)
+
+SAMPLE_SUCCESS_CRITERIA = [
+    "Page loads successfully",
+    "No console errors",
+    "Expected elements are present"
+]
+
+@lru_cache(maxsize=None)
+def build_flow_payloads(template_index: int) -> Tuple[Dict[str, Any], ...]:
+    """Build the sample flow payloads for a test run template (formatted once)."""
+    name = TEST_RUN_TEMPLATES[template_index]["name"]
+    return tuple(
+        {
+            "name": flow_template["name"].format(name=name),
+            "description": flow_template["description"].format(name=name),
+            "instructions": flow_template["instructions"].format(name=name),
+            "estimatedDurationMinutes": 5 + (j * 3),
+            "successCriteria": SAMPLE_SUCCESS_CRITERIA,
+            "metadata": flow_template["metadata"]
+        }
+        for j, flow_template in enumerate(FLOW_TEMPLATES)
+    )
+
 @router.post("/sample-data")
 async def create_sample_data(request: SampleDataRequest):
     """Create sample data for testing the application."""
@@ -205,101 +382,26 @@ async def create_sample_data(request: SampleDataRequest):
             "flows": []
         }
         
-        # Sample test run templates
-        test_run_templates = [
-            {
-                "name": "E-commerce Checkout Flow",
-                "description": "Test the complete checkout process on an e-commerce site",
-                "prompt": "Test adding items to cart, proceeding to checkout, filling payment info, and completing purchase",
-                "metadata": {
-                    "priority": "high",
-                    "tags": ["e-commerce", "checkout", "payment"],
-                    "environment": "staging"
-                }
-            },
-            {
-                "name": "User Registration & Login",
-                "description": "Test user authentication flows",
-                "prompt": "Test user registration with email verification and subsequent login",
-                "metadata": {
-                    "priority": "normal",
-                    "tags": ["auth", "registration", "login"],
-                    "environment": "development"
-                }
-            },
-            {
-                "name": "Search & Navigation",
-                "description": "Test search functionality and site navigation",
-                "prompt": "Test search bar functionality, filters, and navigation between pages",
-                "metadata": {
-                    "priority": "low",
-                    "tags": ["search", "navigation", "ui"],
-                    "environment": "staging"
-                }
-            }
+        runs = [
+            {**template, "flows": list(build_flow_payloads(i)[:max(request.flowsPerRun, 0)])}
+            for i, template in enumerate(TEST_RUN_TEMPLATES[:max(request.testRuns, 0)])
         ]
         
-        # Create test runs
-        for i in range(min(request.testRuns, len(test_run_templates))):
-            template = test_run_templates[i]
-            
-            test_run_id = await call_convex_function("testRuns:create", {
-                "name": template["name"],
-                "description": template["description"],
-                "prompt": template["prompt"],
-                "metadata": template["metadata"]
-            })
-            
+        # One mutation creates every test run and flow
+        result = await call_convex_function("testRuns:createWithFlows", {"runs": runs})
+        invalidate_query_cache()
+        flow_ids = iter(result["flows"])
+        
+        for run, test_run_id in zip(runs, result["testRuns"]):
             created_data["testRuns"].append({
                 "id": test_run_id,
-                "name": template["name"]
+                "name": run["name"]
             })
             
-            # Create flows for this test run
-            flow_templates = [
-                {
-                    "name": f"Flow 1 for {template['name']}",
-                    "description": f"First testing scenario for {template['name']}",
-                    "instructions": f"Navigate to the main page and perform the primary action for {template['name']}",
-                    "metadata": {
-                        "difficulty": "easy",
-                        "category": "primary",
-                        "expectedSteps": 5
-                    }
-                },
-                {
-                    "name": f"Flow 2 for {template['name']}",
-                    "description": f"Secondary testing scenario for {template['name']}",
-                    "instructions": f"Test edge cases and error handling for {template['name']}",
-                    "metadata": {
-                        "difficulty": "medium",
-                        "category": "edge-case",
-                        "expectedSteps": 8
-                    }
-                }
-            ]
-            
-            for j in range(min(request.flowsPerRun, len(flow_templates))):
-                flow_template = flow_templates[j]
-                
-                flow_id = await call_convex_function("flows:create", {
-                    "testRunId": test_run_id,
-                    "name": flow_template["name"],
-                    "description": flow_template["description"],
-                    "instructions": flow_template["instructions"],
-                    "order": j + 1,
-                    "estimatedDurationMinutes": 5 + (j * 3),
-                    "successCriteria": [
-                        "Page loads successfully",
-                        "No console errors",
-                        "Expected elements are present"
-                    ],
-                    "metadata": flow_template["metadata"]
-                })
-                
+            for flow in run["flows"]:
                 created_data["flows"].append({
-                    "id": flow_id,
-                    "name": flow_template["name"],
+                    "id": next(flow_ids),
+                    "name": flow["name"],
                     "testRunId": test_run_id
                 })
         
@@ -309,15 +411,65 @@ async def create_sample_data(request: SampleDataRequest):
         }
         
     except Exception as e:
-        logger.error(f"Failed to create sample data: {str(e)}")
+        logger.error("Failed to create sample data: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to create sample data: {str(e)}")
 
+async def refresh_admin_stats() -> Any:
+    """Fetch test run stats from Convex and store them in the stats cache."""
+    generation = _cache_generation
+    value = await call_convex_function("testRuns:getStats", {})
+    if generation != _cache_generation:
+        # A write landed while this request was in flight
+        return value
+    now = time.monotonic()
+    _stats_cache.update(
+        value=value,
+        fresh_until=now + STATS_FRESH_SECONDS,
+        stale_until=now + STATS_STALE_SECONDS
+    )
+    return value
+
+async def _refresh_admin_stats_in_background() -> None:
+    generation = _cache_generation
+    try:
+        await refresh_admin_stats()
+    except Exception as e:
+        # Keep serving the last known-good value while Convex is unavailable,
+        # unless a write has since invalidated it
+        if generation == _cache_generation:
+            _stats_cache["stale_until"] = time.monotonic() + STATS_STALE_SECONDS
+        logger.warning("Background admin stats refresh failed: %s", e)
+
+async def get_cached_admin_stats() -> Any:
+    """Return test run stats, serving cached values while revalidating."""
+    global _stats_refresh_task
+    now = time.monotonic()
+    
+    if QUERY_CACHE_ENABLED and _stats_cache:
+        if now < _stats_cache["fresh_until"]:
+            return _stats_cache["value"]
+        
+        if now < _stats_cache["stale_until"]:
+            if _stats_refresh_task is None or _stats_refresh_task.done():
+                _stats_refresh_task = asyncio.create_task(_refresh_admin_stats_in_background())
+            return _stats_cache["value"]
+    
+    # Without the cache every read goes to Convex, but the last known-good
+    # value is still served while Convex is unreachable
+    try:
+        return await refresh_admin_stats()
+    except Exception as e:
+        if not _stats_cache:
+            raise
+        logger.warning("Admin stats refresh failed, serving last known value: %s", e)
+        return _stats_cache["value"]
+
 @router.get("/stats")
 async def get_admin_stats():
     """Get comprehensive statistics for the admin dashboard."""
     try:
         # Get test run stats
-        test_run_stats = await call_convex_function("testRuns:getStats", {})
+        test_run_stats = await get_cached_admin_stats()
         
         return {
             "testRuns": test_run_stats,
@@ -326,7 +478,7 @@ async def get_admin_stats():
         }
         
     except Exception as e:
-        logger.error(f"Failed to get admin stats: {str(e)}")
+        logger.error("Failed to get admin stats: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to get admin stats: {str(e)}")
 
 @router.delete("/test-runs/{test_run_id}")
@@ -334,11 +486,12 @@ async def delete_test_run(test_run_id: str):
     """Delete a test run and all its related data."""
     try:
         await call_convex_function("testRuns:remove", {"testRunId": test_run_id})
+        invalidate_query_cache()
         
         return {"message": "Test run deleted successfully"}
         
     except Exception as e:
-        logger.error(f"Failed to delete test run: {str(e)}")
+        logger.error("Failed to delete test run: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to delete test run: {str(e)}")
 
 @router.delete("/flows/{flow_id}")
@@ -346,9 +499,10 @@ async def delete_flow(flow_id: str):
     """Delete a specific flow."""
     try:
         await call_convex_function("flows:remove", {"flowId": flow_id})
+        invalidate_query_cache()
         
         return {"message": "Flow deleted successfully"}
         
     except Exception as e:
-        logger.error(f"Failed to delete flow: {str(e)}")
+        logger.error("Failed to delete flow: %s", e)
         raise HTTPException(status_code=500, detail=f"Failed to delete flow: {str(e)}")
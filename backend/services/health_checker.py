@@ -5,18 +5,23 @@ Tests connectivity and functionality of OpenAI, Browser Use Cloud, and Convex.
 
 import asyncio
 import aiohttp
+from collections import Counter
 import openai
 from datetime import datetime
-from typing import Dict, Any, Optional
+from typing import Awaitable, Dict, Any, Optional, Tuple
 from enum import Enum
 from pydantic import BaseModel
 import time
 import logging
+import re
 
 from backend.config import config
 
 logger = logging.getLogger(__name__)
 
+# Shape of a usable OpenAI key: "sk-" followed by at least 20 token characters
+OPENAI_KEY_PATTERN = re.compile(r"sk-[A-Za-z0-9_\-]{20,}")
+
 class HealthStatus(str, Enum):
     """Health status enumeration."""
     HEALTHY = "healthy"
@@ -38,30 +43,115 @@ class HealthChecker:
     """Comprehensive health checker for all external services."""
     
     def __init__(self):
-        self.openai_client = openai.OpenAI(api_key=config.openai.api_key) if config.openai.api_key else None
+        self._openai_client: Optional[openai.AsyncOpenAI] = None
         self.session_timeout = aiohttp.ClientTimeout(total=config.health_check_timeout)
+        self._session: Optional[aiohttp.ClientSession] = None
+        # aiohttp doesn't close resolvers it was handed, so the checker owns this one
+        self._resolver: Optional[aiohttp.abc.AbstractResolver] = None
+        self._browser_use_ping_url = f"{config.browser_use.base_url}/ping"
+        self._browser_use_headers = {
+            "Authorization": f"Bearer {config.browser_use.api_key}",
+            "Content-Type": "application/json"
+        } if config.browser_use.api_key else {}
+        self._cache: Optional[Tuple[float, Dict[str, ServiceHealth]]] = None
+        self._cache_ttl = 5.0
+        self._inflight = asyncio.Lock()
+        # Only last_checked changes between FastAPI self-checks
+        self._fastapi_health_template = ServiceHealth(
+            service="fastapi",
+            status=HealthStatus.HEALTHY,
+            message="FastAPI server is running",
+            response_time_ms=0.1,
+            last_checked=datetime.now(),
+            details={
+                "version": "1.0.0",
+                "debug": config.debug,
+                "cors_origins": config.cors_origins
+            }
+        )
+    
+    async def _get_session(self) -> aiohttp.ClientSession:
+        """Return the shared HTTP session, creating it on first use."""
+        if self._session is None or self._session.closed:
+            if self._resolver is not None:
+                await self._resolver.close()
+            self._resolver = self._make_resolver()
+            self._session = aiohttp.ClientSession(
+                timeout=self.session_timeout,
+                connector=aiohttp.TCPConnector(
+                    limit=32,
+                    use_dns_cache=True,
+                    ttl_dns_cache=3600,
+                    keepalive_timeout=90,
+                    resolver=self._resolver
+                )
+            )
+        return self._session
+    
+    def _get_openai_client(self) -> openai.AsyncOpenAI:
+        """Return the shared OpenAI client, creating it on first use."""
+        if self._openai_client is None or self._openai_client.is_closed():
+            self._openai_client = openai.AsyncOpenAI(
+                api_key=config.openai.api_key,
+                timeout=config.health_check_timeout
+            )
+        return self._openai_client
+    
+    @staticmethod
+    def _make_resolver() -> aiohttp.abc.AbstractResolver:
+        """Prefer c-ares based DNS; fall back to the threaded resolver without aiodns."""
+        try:
+            return aiohttp.AsyncResolver()
+        except (ImportError, RuntimeError) as e:
+            logger.warning("aiodns unavailable, using threaded DNS resolver: %s", e)
+            return aiohttp.ThreadedResolver()
+    
+    async def aclose(self) -> None:
+        """Close the shared HTTP session, its resolver and the OpenAI client; all are recreated on next use."""
+        # The lock binds to the current event loop; a later lifespan needs a fresh one
+        self._inflight = asyncio.Lock()
+        self._cache = None
+        session, self._session = self._session, None
+        resolver, self._resolver = self._resolver, None
+        openai_client, self._openai_client = self._openai_client, None
+        try:
+            if session is not None:
+                await session.close()
+        finally:
+            try:
+                if resolver is not None:
+                    await resolver.close()
+            finally:
+                if openai_client is not None:
+                    await openai_client.close()
     
     async def check_openai_health(self) -> ServiceHealth:
         """Check OpenAI API health and connectivity."""
         start_time = time.time()
+        now = datetime.now()
         
         try:
-            if not self.openai_client:
+            if not config.openai.api_key:
                 return ServiceHealth(
                     service="openai",
                     status=HealthStatus.UNHEALTHY,
                     message="OpenAI API key not configured",
-                    last_checked=datetime.now(),
+                    last_checked=now,
                     error="Missing API key"
                 )
             
-            # Test with a simple completion request
-            response = await asyncio.to_thread(
-                self.openai_client.chat.completions.create,
-                model="gpt-3.5-turbo",
-                messages=[{"role": "user", "content": "Hello"}],
-                max_tokens=5
-            )
+            # A malformed key can only fail authentication; skip the round trip
+            if not OPENAI_KEY_PATTERN.fullmatch(config.openai.api_key):
+                return ServiceHealth(
+                    service="openai",
+                    status=HealthStatus.UNHEALTHY,
+                    message="Malformed OpenAI API key format",
+                    last_checked=now,
+                    error="Invalid API key format"
+                )
+            
+            # Listing models authenticates the key without spending tokens
+            models = await self._get_openai_client().models.list()
             
             response_time = (time.time() - start_time) * 1000
             
@@ -70,14 +160,9 @@ class HealthChecker:
                 status=HealthStatus.HEALTHY,
                 message="OpenAI API is accessible and responding",
                 response_time_ms=response_time,
-                last_checked=datetime.now(),
+                last_checked=now,
                 details={
-                    "model": response.model,
-                    "usage": {
-                        "prompt_tokens": response.usage.prompt_tokens if response.usage else 0,
-                        "completion_tokens": response.usage.completion_tokens if response.usage else 0,
-                        "total_tokens": response.usage.total_tokens if response.usage else 0
-                    }
+                    "models_sample": [model.id for model in models.data[:3]]
                 }
             )
             
@@ -87,7 +172,7 @@ class HealthChecker:
                 status=HealthStatus.UNHEALTHY,
                 message="OpenAI authentication failed",
                 response_time_ms=(time.time() - start_time) * 1000,
-                last_checked=datetime.now(),
+                last_checked=now,
                 error="Invalid API key"
             )
         except openai.RateLimitError:
@@ -96,7 +181,7 @@ class HealthChecker:
                 status=HealthStatus.DEGRADED,
                 message="OpenAI rate limit exceeded",
                 response_time_ms=(time.time() - start_time) * 1000,
-                last_checked=datetime.now(),
+                last_checked=now,
                 error="Rate limit exceeded"
             )
         except Exception as e:
@@ -105,13 +190,14 @@ class HealthChecker:
                 status=HealthStatus.UNHEALTHY,
                 message="OpenAI API request failed",
                 response_time_ms=(time.time() - start_time) * 1000,
-                last_checked=datetime.now(),
+                last_checked=now,
                 error=str(e)
             )
     
     async def check_browser_use_health(self) -> ServiceHealth:
         """Check Browser Use Cloud API health and connectivity."""
         start_time = time.time()
+        now = datetime.now()
         
         try:
             if not config.browser_use.api_key:
@@ -119,52 +205,48 @@ class HealthChecker:
                     service="browser-use-cloud",
                     status=HealthStatus.UNHEALTHY,
                     message="Browser Use Cloud API key not configured",
-                    last_checked=datetime.now(),
+                    last_checked=now,
                     error="Missing API key"
                 )
             
-            async with aiohttp.ClientSession(timeout=self.session_timeout) as session:
-                headers = {
-                    "Authorization": f"Bearer {config.browser_use.api_key}",
-                    "Content-Type": "application/json"
-                }
+            session = await self._get_session()
+            
+            # Test health endpoint or a simple API call
+            async with session.get(
+                self._browser_use_ping_url,
+                headers=self._browser_use_headers
+            ) as response:
+                response_time = (time.time() - start_time) * 1000
                 
-                # Test health endpoint or a simple API call
-                async with session.get(
-                    f"{config.browser_use.base_url}/ping",
-                    headers=headers
-                ) as response:
-                    response_time = (time.time() - start_time) * 1000
+                if response.status == 200:
+                    return ServiceHealth(
+                        service="browser-use-cloud",
+                        status=HealthStatus.HEALTHY,
+                        message="Browser Use Cloud API is accessible",
+                        response_time_ms=response_time,
+                        last_checked=now,
+                        details={
+                            "status_code": response.status,
+                            "base_url": config.browser_use.base_url
+                        }
+                    )
+                else:
+                    return ServiceHealth(
+                        service="browser-use-cloud",
+                        status=HealthStatus.DEGRADED,
+                        message=f"Browser Use Cloud API returned status {response.status}",
+                        response_time_ms=response_time,
+                        last_checked=now,
+                        error=f"HTTP {response.status}"
+                    )
                     
-                    if response.status == 200:
-                        return ServiceHealth(
-                            service="browser-use-cloud",
-                            status=HealthStatus.HEALTHY,
-                            message="Browser Use Cloud API is accessible",
-                            response_time_ms=response_time,
-                            last_checked=datetime.now(),
-                            details={
-                                "status_code": response.status,
-                                "base_url": config.browser_use.base_url
-                            }
-                        )
-                    else:
-                        return ServiceHealth(
-                            service="browser-use-cloud",
-                            status=HealthStatus.DEGRADED,
-                            message=f"Browser Use Cloud API returned status {response.status}",
-                            response_time_ms=response_time,
-                            last_checked=datetime.now(),
-                            error=f"HTTP {response.status}"
-                        )
-                        
         except asyncio.TimeoutError:
             return ServiceHealth(
                 service="browser-use-cloud",
                 status=HealthStatus.UNHEALTHY,
                 message="Browser Use Cloud API request timed out",
                 response_time_ms=(time.time() - start_time) * 1000,
-                last_checked=datetime.now(),
+                last_checked=now,
                 error="Request timeout"
             )
         except Exception as e:
@@ -173,13 +255,14 @@ class HealthChecker:
                 status=HealthStatus.UNHEALTHY,
                 message="Browser Use Cloud API request failed",
                 response_time_ms=(time.time() - start_time) * 1000,
-                last_checked=datetime.now(),
+                last_checked=now,
                 error=str(e)
             )
     
     async def check_convex_health(self) -> ServiceHealth:
         """Check Convex database health and connectivity."""
         start_time = time.time()
+        now = datetime.now()
         
         try:
             if not config.convex.deployment_url:
@@ -187,44 +270,44 @@ class HealthChecker:
                     service="convex",
                     status=HealthStatus.UNHEALTHY,
                     message="Convex deployment URL not configured",
-                    last_checked=datetime.now(),
+                    last_checked=now,
                     error="Missing deployment URL"
                 )
             
-            async with aiohttp.ClientSession(timeout=self.session_timeout) as session:
-                # Test Convex HTTP endpoint
-                async with session.get(config.convex.deployment_url) as response:
-                    response_time = (time.time() - start_time) * 1000
+            session = await self._get_session()
+            # Test Convex HTTP endpoint
+            async with session.get(config.convex.deployment_url) as response:
+                response_time = (time.time() - start_time) * 1000
+                
+                if response.status == 200:
+                    return ServiceHealth(
+                        service="convex",
+                        status=HealthStatus.HEALTHY,
+                        message="Convex database is accessible",
+                        response_time_ms=response_time,
+                        last_checked=now,
+                        details={
+                            "status_code": response.status,
+                            "deployment_url": config.convex.deployment_url
+                        }
+                    )
+                else:
+                    return ServiceHealth(
+                        service="convex",
+                        status=HealthStatus.DEGRADED,
+                        message=f"Convex returned status {response.status}",
+                        response_time_ms=response_time,
+                        last_checked=now,
+                        error=f"HTTP {response.status}"
+                    )
                     
-                    if response.status == 200:
-                        return ServiceHealth(
-                            service="convex",
-                            status=HealthStatus.HEALTHY,
-                            message="Convex database is accessible",
-                            response_time_ms=response_time,
-                            last_checked=datetime.now(),
-                            details={
-                                "status_code": response.status,
-                                "deployment_url": config.convex.deployment_url
-                            }
-                        )
-                    else:
-                        return ServiceHealth(
-                            service="convex",
-                            status=HealthStatus.DEGRADED,
-                            message=f"Convex returned status {response.status}",
-                            response_time_ms=response_time,
-                            last_checked=datetime.now(),
-                            error=f"HTTP {response.status}"
-                        )
-                        
         except asyncio.TimeoutError:
             return ServiceHealth(
                 service="convex",
                 status=HealthStatus.UNHEALTHY,
                 message="Convex database request timed out",
                 response_time_ms=(time.time() - start_time) * 1000,
-                last_checked=datetime.now(),
+                last_checked=now,
                 error="Request timeout"
             )
         except Exception as e:
@@ -233,40 +316,58 @@ class HealthChecker:
                 status=HealthStatus.UNHEALTHY,
                 message="Convex database request failed",
                 response_time_ms=(time.time() - start_time) * 1000,
-                last_checked=datetime.now(),
+                last_checked=now,
                 error=str(e)
             )
     
     async def check_fastapi_health(self) -> ServiceHealth:
         """Check FastAPI server internal health."""
-        return ServiceHealth(
-            service="fastapi",
-            status=HealthStatus.HEALTHY,
-            message="FastAPI server is running",
-            response_time_ms=0.1,
-            last_checked=datetime.now(),
-            details={
-                "version": "1.0.0",
-                "debug": config.debug,
-                "cors_origins": config.cors_origins
-            }
-        )
+        return self._fastapi_health_template.model_copy(update={"last_checked": datetime.now()})
+    
+    async def _with_budget(self, service: str, probe: Awaitable[ServiceHealth]) -> ServiceHealth:
+        """Run a probe, reporting it unhealthy if it exceeds the health check timeout."""
+        try:
+            return await asyncio.wait_for(probe, timeout=config.health_check_timeout)
+        except asyncio.TimeoutError:
+            return ServiceHealth(
+                service=service,
+                status=HealthStatus.UNHEALTHY,
+                message="Health check timed out",
+                response_time_ms=config.health_check_timeout * 1000,
+                last_checked=datetime.now(),
+                error="Probe timeout"
+            )
+    
+    async def check_all_services(self, force_refresh: bool = False) -> Dict[str, ServiceHealth]:
+        """Check health of all services, sharing recent results between callers."""
+        if not force_refresh and self._cache and time.monotonic() - self._cache[0] < self._cache_ttl:
+            return self._cache[1]
+        
+        # Single-flight: concurrent callers wait for one sweep instead of starting their own
+        async with self._inflight:
+            if not force_refresh and self._cache and time.monotonic() - self._cache[0] < self._cache_ttl:
+                return self._cache[1]
+            
+            results = await self._run_all_checks()
+            self._cache = (time.monotonic(), results)
+            return results
     
-    async def check_all_services(self) -> Dict[str, ServiceHealth]:
+    async def _run_all_checks(self) -> Dict[str, ServiceHealth]:
         """Check health of all external services concurrently."""
         logger.info("Starting comprehensive health check for all services")
         
         # Run all health checks concurrently
         health_checks = await asyncio.gather(
-            self.check_fastapi_health(),
-            self.check_openai_health(),
-            self.check_browser_use_health(),
-            self.check_convex_health(),
+            self._with_budget("fastapi", self.check_fastapi_health()),
+            self._with_budget("openai", self.check_openai_health()),
+            self._with_budget("browser-use-cloud", self.check_browser_use_health()),
+            self._with_budget("convex", self.check_convex_health()),
             return_exceptions=True
         )
         
         results = {}
         service_names = ["fastapi", "openai", "browser-use-cloud", "convex"]
+        checked_at = datetime.now()
         
         for i, result in enumerate(health_checks):
             service_name = service_names[i]
@@ -276,7 +377,7 @@ class HealthChecker:
                     service=service_name,
                     status=HealthStatus.UNHEALTHY,
                     message=f"Health check failed with exception",
-                    last_checked=datetime.now(),
+                    last_checked=checked_at,
                     error=str(result)
                 )
             else:
@@ -286,28 +387,31 @@ class HealthChecker:
         healthy_services = sum(1 for health in results.values() if health.status == HealthStatus.HEALTHY)
         total_services = len(results)
         
-        logger.info(f"Health check completed: {healthy_services}/{total_services} services healthy")
+        logger.info("Health check completed: %s/%s services healthy", healthy_services, total_services)
         
         return results
     
-    async def get_overall_health_status(self) -> Dict[str, Any]:
+    async def get_overall_health_status(self, force_refresh: bool = False) -> Dict[str, Any]:
         """Get overall system health status with summary."""
-        service_health = await self.check_all_services()
+        service_health = await self.check_all_services(force_refresh=force_refresh)
         
-        # Calculate overall status
-        statuses = [health.status for health in service_health.values()]
+        # Tally statuses in a single pass
+        counts = Counter(health.status for health in service_health.values())
+        total = len(service_health)
+        healthy = counts[HealthStatus.HEALTHY]
+        degraded = counts[HealthStatus.DEGRADED]
+        unhealthy = counts[HealthStatus.UNHEALTHY]
+        unknown = counts[HealthStatus.UNKNOWN]
         
-        if all(status == HealthStatus.HEALTHY for status in statuses):
+        if healthy == total:
             overall_status = HealthStatus.HEALTHY
             overall_message = "All services are healthy"
-        elif any(status == HealthStatus.UNHEALTHY for status in statuses):
+        elif unhealthy:
             overall_status = HealthStatus.UNHEALTHY
-            unhealthy_count = sum(1 for status in statuses if status == HealthStatus.UNHEALTHY)
-            overall_message = f"{unhealthy_count} service(s) are unhealthy"
-        elif any(status == HealthStatus.DEGRADED for status in statuses):
+            overall_message = f"{unhealthy} service(s) are unhealthy"
+        elif degraded:
             overall_status = HealthStatus.DEGRADED
-            degraded_count = sum(1 for status in statuses if status == HealthStatus.DEGRADED)
-            overall_message = f"{degraded_count} service(s) are degraded"
+            overall_message = f"{degraded} service(s) are degraded"
         else:
             overall_status = HealthStatus.UNKNOWN
             overall_message = "Unable to determine overall health status"
@@ -316,13 +420,13 @@ class HealthChecker:
             "overall_status": overall_status,
             "overall_message": overall_message,
             "timestamp": datetime.now().isoformat(),
-            "services": {name: health.dict() for name, health in service_health.items()},
+            "services": {name: health.model_dump(mode="json") for name, health in service_health.items()},
             "summary": {
-                "total_services": len(service_health),
-                "healthy": sum(1 for h in service_health.values() if h.status == HealthStatus.HEALTHY),
-                "degraded": sum(1 for h in service_health.values() if h.status == HealthStatus.DEGRADED),
-                "unhealthy": sum(1 for h in service_health.values() if h.status == HealthStatus.UNHEALTHY),
-                "unknown": sum(1 for h in service_health.values() if h.status == HealthStatus.UNKNOWN)
+                "total_services": total,
+                "healthy": healthy,
+                "degraded": degraded,
+                "unhealthy": unhealthy,
+                "unknown": unknown
             }
         }
 
@@ -38,6 +38,95 @@ export const create = mutation({
   },
 });
 
+/**
+ * Create several test runs and their flows in a single mutation
+ */
+export const createWithFlows = mutation({
+  args: {
+    runs: v.array(
+      v.object({
+        name: v.string(),
+        description: v.optional(v.string()),
+        prompt: v.string(),
+        metadata: v.optional(
+          v.object({
+            estimatedDurationMinutes: v.optional(v.number()),
+            priority: v.optional(
+              v.union(v.literal("low"), v.literal("normal"), v.literal("high")),
+            ),
+            tags: v.optional(v.array(v.string())),
+            environment: v.optional(v.string()),
+          }),
+        ),
+        flows: v.array(
+          v.object({
+            name: v.string(),
+            description: v.string(),
+            instructions: v.string(),
+            estimatedDurationMinutes: v.optional(v.number()),
+            successCriteria: v.optional(v.array(v.string())),
+            metadata: v.optional(
+              v.object({
+                difficulty: v.optional(
+                  v.union(
+                    v.literal("easy"),
+                    v.literal("medium"),
+                    v.literal("hard"),
+                  ),
+                ),
+                category: v.optional(v.string()),
+                targetUrl: v.optional(v.string()),
+                expectedSteps: v.optional(v.number()),
+              }),
+            ),
+          }),
+        ),
+      }),
+    ),
+  },
+  returns: v.object({
+    testRuns: v.array(v.id("testRuns")),
+    flows: v.array(v.id("flows")),
+  }),
+  handler: async (ctx, args) => {
+    const testRunIds: Id<"testRuns">[] = [];
+    const flowIds: Id<"flows">[] = [];
+
+    for (const run of args.runs) {
+      const testRunId = await ctx.db.insert("testRuns", {
+        name: run.name,
+        description: run.description,
+        prompt: run.prompt,
+        status: "generating",
+        totalFlows: run.flows.length,
+        completedFlows: 0,
+        failedFlows: 0,
+        metadata: run.metadata,
+      });
+      testRunIds.push(testRunId);
+
+      for (let i = 0; i < run.flows.length; i++) {
+        const flow = run.flows[i];
+        const flowId = await ctx.db.insert("flows", {
+          testRunId,
+          name: flow.name,
+          description: flow.description,
+          instructions: flow.instructions,
+          status: "pending",
+          order: i + 1,
+          estimatedDurationMinutes: flow.estimatedDurationMinutes,
+          successCriteria: flow.successCriteria,
+          metadata: flow.metadata,
+        });
+        flowIds.push(flowId);
+      }
+    }
+
+    // Flow IDs are returned flat, in run order then flow order
+    return { testRuns: testRunIds, flows: flowIds };
+  },
+});
+
 /**
  * Get a test run by ID
  */